@@ -10,9 +10,33 @@ from typing import Any, Callable, Dict, Generic, List, TypeVar, Union
 import struct
 import functools
 
+_THIS_DIR = Path(__file__).resolve().parent
+
+# Add paths for importing modules. The compiled codec lives in src/; without it
+# AtomDataclass uses its pure-Python path.
+sys.path.append(str(_THIS_DIR))
+sys.path.append(str(_THIS_DIR.joinpath('src')))
+try:
+    import atom_codec as _atom_codec
+except ImportError:
+    _atom_codec = None
+
 T = TypeVar('T')
 
+# One-byte wire tags; must stay in sync with src/atom_codec.pyx.
+_TAG_STR, _TAG_INT, _TAG_FLOAT, _TAG_BOOL, _TAG_LIST, _TAG_DICT, _TAG_UNKNOWN = range(7)
+# Exact-type lookup, so bool never falls through to int.
+_TYPE_TAG_OF = {str: _TAG_STR, int: _TAG_INT, float: _TAG_FLOAT, bool: _TAG_BOOL, list: _TAG_LIST, dict: _TAG_DICT}
+_TYPE_NAMES = {str: 'string', int: 'integer', float: 'float', bool: 'boolean', list: 'list', dict: 'dictionary'}
+
+# Precompiled wire formats, so the codec doesn't re-parse format strings per element.
+# Integers and lengths are varints instead (see _write_varint).
+_S_D = struct.Struct('!d')
+_S_B = struct.Struct('?')
+
 class Atom(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def encode(self) -> bytes:
         pass
@@ -36,12 +60,22 @@ class Atom(ABC):
 
 @dataclass(frozen=True)
 class AtomDataclass(Generic[T], Atom):
+    # Declared by hand rather than with slots=True, which rebuilds the class and
+    # breaks the frozen __setattr__ that AtomDataclass[int](...) goes through.
+    # data_type/data_type_tag are derived in __post_init__, so they are plain
+    # slots rather than dataclass fields.
+    __slots__ = ('value', 'data_type', 'data_type_tag')
+
     value: T
-    data_type: str = field(init=False)
 
     def __post_init__(self):
-        data_type_name = type(self.value).__name__
-        object.__setattr__(self, 'data_type', data_type_name.lower())
+        value_type = type(self.value)
+        object.__setattr__(self, 'data_type', _TYPE_NAMES.get(value_type, 'unknown'))
+        object.__setattr__(self, 'data_type_tag', _TYPE_TAG_OF.get(value_type, _TAG_UNKNOWN))
+
+    def __reduce__(self):
+        # Frozen slots can't be restored attribute by attribute; rebuild from the value.
+        return type(self), (self.value,)
 
     def __repr__(self):
         return f"AtomDataclass(id={id(self)}, value={self.value}, data_type='{self.data_type}')"
@@ -88,101 +122,229 @@ class AtomDataclass(Generic[T], Atom):
 
     @staticmethod
     def _determine_data_type(data: Any) -> str:
-        data_type = type(data).__name__
-        if data_type == 'str':
-            return 'string'
-        elif data_type == 'int':
-            return 'integer'
-        elif data_type == 'float':
-            return 'float'
-        elif data_type == 'bool':
-            return 'boolean'
-        elif data_type == 'list':
-            return 'list'
-        elif data_type == 'dict':
-            return 'dictionary'
-        else:
-            return 'unknown'
+        return _TYPE_NAMES.get(type(data), 'unknown')
 
     def encode(self) -> bytes:
-        data_type_bytes = self.data_type.encode('utf-8')
-        data_bytes = self._encode_data()
-        header = struct.pack('!I', len(data_bytes))
-        return header + data_type_bytes + data_bytes
-    
+        if _atom_codec is not None:
+            return _atom_codec.encode(self.value)
+        out = bytearray()
+        _encode_value(out, self.value)
+        return bytes(out)
+
     def _encode_data(self) -> bytes:
-        if self.data_type == 'string':
-            return self.value.encode('utf-8')
-        elif self.data_type == 'integer':
-            return struct.pack('!q', self.value)
-        elif self.data_type == 'float':
-            return struct.pack('!d', self.value)
-        elif self.data_type == 'boolean':
-            return struct.pack('?', self.value)
-        elif self.data_type == 'list':
-            return b''.join([AtomDataclass(element)._encode_data() for element in self.value])
-        elif self.data_type == 'dictionary':
-            return b''.join(
-                [AtomDataclass(key)._encode_data() + AtomDataclass(value)._encode_data() for key, value in self.value.items()]
-            )
-        else:
-            raise ValueError(f"Unsupported data type: {self.data_type}")
-    
+        if _atom_codec is not None:
+            return _atom_codec.encode(self.value)[1:]
+        out = bytearray()
+        _encode_value(out, self.value)
+        del out[0]  # Drops the tag in place; bytearray trims its head without moving the payload.
+        return bytes(out)
+
     def decode(self, data: bytes) -> None:
-        header_length = struct.unpack('!I', data[:4])[0]
-        data_type_bytes = data[4:4 + header_length]
-        data_type = data_type_bytes.decode('utf-8')
-        data_bytes = data[4 + header_length:]
-
-        if data_type == 'string':
-            value = data_bytes.decode('utf-8')
-        elif data_type == 'integer':
-            value = struct.unpack('!q', data_bytes)[0]
-        elif data_type == 'float':
-            value = struct.unpack('!d', data_bytes)[0]
-        elif data_type == 'boolean':
-            value = struct.unpack('?', data_bytes)[0]
-        elif data_type == 'list':
-            value = []
-            offset = 0
-            while offset < len(data_bytes):
-                element = AtomDataclass(None)
-                element_size = element.decode(data_bytes[offset:])
-                value.append(element.value)
-                offset += element_size
-        elif data_type == 'dictionary':
-            value = {}
-            offset = 0
-            while offset < len(data_bytes):
-                key = AtomDataclass(None)
-                key_size = key.decode(data_bytes[offset:])
-                offset += key_size
-                val = AtomDataclass(None)
-                value_size = val.decode(data_bytes[offset:])
-                offset += value_size
-                value[key.value] = val.value
+        if _atom_codec is not None:
+            value, _ = _atom_codec.decode(data, 0)
         else:
-            raise ValueError(f"Unsupported data type: {data_type}")
-
-        self.value = value
-        object.__setattr__(self, 'data_type', data_type)
+            value, _ = _decode_value(data, 0)
+        object.__setattr__(self, 'value', value)
+        value_type = type(value)
+        object.__setattr__(self, 'data_type', _TYPE_NAMES.get(value_type, 'unknown'))
+        object.__setattr__(self, 'data_type_tag', _TYPE_TAG_OF.get(value_type, _TAG_UNKNOWN))
 
     def execute(self, *args, **kwargs) -> Any:
         pass
 
 
+# Pure-Python codec. Both directions walk nested values with an explicit stack
+# rather than recursing, so each nested node costs a loop iteration instead of a
+# Python frame. Scalar payloads go through per-tag tables: encoders append to
+# `out`; decoders read at `offset` and return (value, new_offset).
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _write_varint(out: bytearray, n: int) -> None:
+    """Appends unsigned LEB128: 7 bits per byte, low group first, high bit = more follows."""
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data: bytes, offset: int):
+    result = shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("Truncated atom data")
+        byte = data[offset]
+        offset += 1
+        # A uint64 fits in ten groups, the tenth holding only the top bit.
+        if shift == 63 and byte > 1:
+            raise ValueError("Varint too long")
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def _encode_string(out: bytearray, value: str) -> None:
+    data_bytes = value.encode('utf-8')
+    _write_varint(out, len(data_bytes))
+    out += data_bytes
+
+
+def _encode_integer(out: bytearray, value: int) -> None:
+    if not _INT64_MIN <= value <= _INT64_MAX:
+        raise OverflowError(f"Integer out of int64 range: {value}")
+    # Zigzag maps small magnitudes of either sign to small varints.
+    _write_varint(out, (value << 1) ^ (value >> 63))
+
+
+def _encode_float(out: bytearray, value: float) -> None:
+    out += _S_D.pack(value)
+
+
+def _encode_boolean(out: bytearray, value: bool) -> None:
+    out += _S_B.pack(value)
+
+
+# Strings at least this long are decoded through a memoryview rather than a
+# sliced copy; below it, building the view costs more than the copy saves.
+_ZERO_COPY_STRING_MIN = 1 << 16
+
+
+def _decode_string(data: bytes, offset: int):
+    length, offset = _read_varint(data, offset)
+    end = offset + length
+    if end > len(data):
+        raise ValueError("Truncated atom data")
+    if length >= _ZERO_COPY_STRING_MIN:
+        return str(memoryview(data)[offset:end], 'utf-8'), end
+    return data[offset:end].decode('utf-8'), end
+
+
+def _decode_integer(data: bytes, offset: int):
+    zigzag, offset = _read_varint(data, offset)
+    return (zigzag >> 1) ^ -(zigzag & 1), offset
+
+
+def _decode_float(data: bytes, offset: int):
+    if offset + 8 > len(data):
+        raise ValueError("Truncated atom data")
+    return _S_D.unpack_from(data, offset)[0], offset + 8
+
+
+def _decode_boolean(data: bytes, offset: int):
+    if offset >= len(data):
+        raise ValueError("Truncated atom data")
+    return _S_B.unpack_from(data, offset)[0], offset + 1
+
+
+_ENCODERS = (_encode_string, _encode_integer, _encode_float, _encode_boolean)
+_DECODERS = (_decode_string, _decode_integer, _decode_float, _decode_boolean)
+
+
+def _encode_value(out: bytearray, root: Any) -> None:
+    stack = [root]
+    while stack:
+        value = stack.pop()
+        tag = _TYPE_TAG_OF.get(type(value), _TAG_UNKNOWN)
+        if tag == _TAG_UNKNOWN:
+            raise ValueError(f"Unsupported data type: {type(value).__name__.lower()}")
+        out.append(tag)
+        if tag == _TAG_LIST:
+            _write_varint(out, len(value))
+            stack.extend(reversed(value))
+        elif tag == _TAG_DICT:
+            _write_varint(out, len(value))
+            for key, val in reversed(value.items()):
+                stack.append(val)
+                stack.append(key)
+        else:
+            _ENCODERS[tag](out, value)
+
+
+_NO_KEY = object()
+
+
+def _decode_value(data: bytes, offset: int):
+    """Decodes one tagged value at `offset`; returns (value, offset past it)."""
+    if not 0 <= offset <= len(data):
+        raise ValueError(f"Offset {offset} outside buffer of length {len(data)}")
+    # Open containers as [container, children still expected, pending dict key].
+    stack = []
+    while True:
+        if offset >= len(data):
+            raise ValueError("Truncated atom data")
+        tag = data[offset]
+        offset += 1
+        if tag == _TAG_LIST or tag == _TAG_DICT:
+            if stack and stack[-1][2] is _NO_KEY and type(stack[-1][0]) is dict:
+                raise ValueError("Unhashable dictionary key")
+            count, offset = _read_varint(data, offset)
+            value = [] if tag == _TAG_LIST else {}
+            if count:
+                stack.append([value, count, _NO_KEY])
+                continue
+        elif tag < _TAG_LIST:
+            value, offset = _DECODERS[tag](data, offset)
+        else:
+            raise ValueError(f"Unsupported data type tag: {tag}")
+
+        # Attach the finished value to its parent, closing any containers it completes.
+        while stack:
+            frame = stack[-1]
+            container = frame[0]
+            if type(container) is list:
+                container.append(value)
+            elif frame[2] is _NO_KEY:
+                frame[2] = value
+                break
+            else:
+                container[frame[2]] = value
+                frame[2] = _NO_KEY
+            frame[1] -= 1
+            if frame[1]:
+                break
+            stack.pop()
+            value = container
+        else:
+            return value, offset
+
+
+def _reflexivity(x):
+    return x == x
+
+
+def _symmetry(x, y):
+    return x == y
+
+
+def _transitivity(x, y, z):
+    return (x == y) and (y == z) and (x == z)
+
+
+def _transparency(f, x, y):
+    return f(True, x, y) if x == y else None
+
+
+def _top(x, _):
+    return x
+
+
+def _bottom(_, y):
+    return y
+
+
 @dataclass
 class FormalTheory(Generic[T]):
-    reflexivity: Callable[[T], bool] = lambda x: x == x
-    symmetry: Callable[[T, T], bool] = lambda x, y: x == y
-    transitivity: Callable[[T, T, T], bool] = lambda x, y, z: (x == y) and (y == z) and (x == z)
-    transparency: Callable[[Callable[..., T], T, T], T] = lambda f, x, y: f(True, x, y) if x == y else None
+    reflexivity: Callable[[T], bool] = _reflexivity
+    symmetry: Callable[[T, T], bool] = _symmetry
+    transitivity: Callable[[T, T, T], bool] = _transitivity
+    transparency: Callable[[Callable[..., T], T, T], T] = _transparency
     case_base: Dict[str, Callable[[T, T], T]] = field(default_factory=dict)
     
     def __post_init__(self):
         self.case_base = {
-            '⊤': lambda x, _: x,
-            '⊥': lambda _, y: y,
+            '⊤': _top,
+            '⊥': _bottom,
             'a': self.if_else_a
         }
     
@@ -196,8 +358,12 @@ class FormalTheory(Generic[T]):
     def compare(self, atoms: List[AtomDataclass[T]]) -> bool:
         if not atoms:
             return False
-        comparison = [self.symmetry(atoms[0].value, atoms[i].value) for i in range(1, len(atoms))]
-        return all(comparison)
+        first = atoms[0].value
+        symmetry = self.symmetry
+        for atom in atoms[1:]:
+            if not symmetry(first, atom.value):
+                return False
+        return True
 
     def __repr__(self):
         case_base_repr = {
@@ -217,7 +383,7 @@ _lock = threading.Lock()
 
 
 def _init_basic_logging():
-    basic_log_file_path = Path(__file__).resolve().parent.joinpath('logs', 'setup.log')
+    basic_log_file_path = _THIS_DIR.joinpath('logs', 'setup.log')
     basic_log_file_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure the logs directory exists
     logging.basicConfig(
         filename=str(basic_log_file_path),  # Convert Path object to string for compatibility
@@ -231,63 +397,73 @@ def _init_basic_logging():
 _init_basic_logging()
 
 
-def main() -> logging.Logger:
-    """Configures logging for the app.
-
-    Returns:
-        logging.Logger: The logger for the module.
-    """
-    # Find the current directory for logging
-    current_dir = Path(__file__).resolve().parent
+_LOGGING_CONFIG = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '[%(levelname)s]%(asctime)s||%(name)s: %(message)s',
+            'datefmt': '%Y-%m-%d~%H:%M:%S%z'
+        },
+    },
+    'handlers': {
+        'console': {
+            'level': 'INFO',  # Explicitly set level to 'INFO'
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+            'stream': 'ext://sys.stdout'
+        },
+        'file': {
+            'level': 'INFO',  # Explicitly set level to 'INFO'
+            'formatter': 'default',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': None,  # Filled in by main() once the logs directory is known
+            'maxBytes': 10485760,  # 10MB
+            'backupCount': 10
+        }
+    },
+    'root': {
+        'level': logging.INFO,
+        'handlers': ['console', 'file']
+    }
+}
+_configured = False
+
+
+@functools.lru_cache(maxsize=1)
+def _discover_logs_dir() -> Path:
+    """Finds the nearest `logs` directory at or above this file, creating one here if there is none."""
+    current_dir = _THIS_DIR
     while not (current_dir / 'logs').exists():
-        current_dir = current_dir.parent
-        if current_dir == Path('/'):
+        if current_dir == current_dir.parent:
+            current_dir = _THIS_DIR
             break
-    # Ensure the logs directory exists
-    logs_dir = Path(__file__).resolve().parent.joinpath('logs')
+        current_dir = current_dir.parent
+    logs_dir = current_dir / 'logs'
     logs_dir.mkdir(exist_ok=True)
-    # Add paths for importing modules
-    sys.path.append(str(Path(__file__).resolve().parent))
-    sys.path.append(str(Path(__file__).resolve().parent.joinpath('src')))
-    with _lock:
-        logging_config = {
-            'version': 1,
-            'disable_existing_loggers': False,
-            'formatters': {
-                'default': {
-                    'format': '[%(levelname)s]%(asctime)s||%(name)s: %(message)s',
-                    'datefmt': '%Y-%m-%d~%H:%M:%S%z'
-                },
-            },
-            'handlers': {
-                'console': {
-                    'level': 'INFO',  # Explicitly set level to 'INFO'
-                    'class': 'logging.StreamHandler',
-                    'formatter': 'default',
-                    'stream': 'ext://sys.stdout'
-                },
-                'file': {
-                    'level': 'INFO',  # Explicitly set level to 'INFO'
-                    'formatter': 'default',
-                    'class': 'logging.handlers.RotatingFileHandler',
-                    'filename': str(logs_dir / 'app.log'),  # Convert Path object to string for compatibility
-                    'maxBytes': 10485760,  # 10MB
-                    'backupCount': 10
-                }
-            },
-            'root': {
-                'level': logging.INFO,
-                'handlers': ['console', 'file']
-            }
-        }
+    return logs_dir
 
-        dictConfig(logging_config)
 
-        logger = logging.getLogger(__name__)
-        logger.info(f'\nSource_file: {__file__}|'
-                    f'\nWorking_dir: {current_dir}|')
+def main() -> logging.Logger:
+    """Configures logging for the app. Only the first call does any work.
 
+    Returns:
+        logging.Logger: The logger for the module.
+    """
+    global _configured
+    logger = logging.getLogger(__name__)
+    if _configured:
         return logger
+    logs_dir = _discover_logs_dir()
+    with _lock:
+        if not _configured:
+            _LOGGING_CONFIG['handlers']['file']['filename'] = str(logs_dir / 'app.log')
+            dictConfig(_LOGGING_CONFIG)
+            _configured = True
+            logger.info(f'\nSource_file: {__file__}|'
+                        f'\nWorking_dir: {logs_dir.parent}|')
+
+    return logger
 
 
 if __name__ == '__main__':
@@ -298,7 +474,7 @@ if __name__ == '__main__':
     # Example FormalTheory usage:
     formal_theory = FormalTheory[int]()
 
-    print(atom1)              # AtomDataclass(id=..., value=5, data_type='int')
-    print(atom2)              # AtomDataclass(id=..., value=5, data_type='int')
+    print(atom1)              # AtomDataclass(id=..., value=5, data_type='integer')
+    print(atom2)              # AtomDataclass(id=..., value=5, data_type='integer')
     print(formal_theory.compare([atom1, atom2]))  # True
     print(formal_theory)      # Display representation of FormalTheory instance
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""Builds the optional compiled codec in place::
+
+    python setup.py build_ext --inplace
+
+which leaves ``atom_codec`` in src/, where main.py imports it from. Packaging
+itself is handled by pdm (see pyproject.toml).
+"""
+from Cython.Build import cythonize
+from setuptools import Extension, setup
+
+setup(
+    package_dir={"": "src"},
+    ext_modules=cythonize([Extension("atom_codec", ["src/atom_codec.pyx"])]),
+)
@@ -1,58 +1,526 @@
-import uuid
+import asyncio
+import atexit
+import itertools
 import threading
+import weakref
 import logging
-from openai import OpenAI
+import os
+import re
+import sys
+import time
+import hashlib
+from collections import OrderedDict
+import diskcache
+import httpx
+import numpy as np
+import orjson
+from prompt_toolkit import PromptSession
+from openai import APIError, APIStatusError, AsyncOpenAI, OpenAI, OpenAIError
 from abc import ABC
 from src.app.protocol import BaseContextManager
 
+# One keep-alive HTTP/2 pool for every client in the process, so contexts reuse
+# connections instead of paying a fresh TCP + TLS handshake each.
+_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+_shared_http = httpx.Client(http2=True, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS)
+atexit.register(_shared_http.close)
 
-class ThreadSafeContextManager(BaseContextManager, ABC):
+# One OpenAI client per (api_key, base_url), alive as long as some context holds it.
+_clients: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+_clients_lock = threading.Lock()
+
+
+def _get_client(api_key: str, base_url: str | None = None) -> OpenAI:
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = OpenAI(api_key=api_key, base_url=base_url, http_client=_shared_http)
+        return client
+
+# Streamed tokens are flushed to the terminal once per this many chunks, or on
+# the first token more than this many seconds after the last flush, so slow
+# models still show each token as it arrives.
+_FLUSH_EVERY = 8
+_FLUSH_INTERVAL = 0.016
+
+# Once the history's text exceeds this many characters, everything between the
+# system prompt and the last _KEEP_TURNS messages is folded into one summary.
+_HISTORY_BUDGET = 24_000
+_KEEP_TURNS = 4
+
+# Mechanical turns (summarise, format, translate) go to a small model; anything
+# that needs reasoning stays on whatever model the endpoint has loaded. Both are
+# overridable per deployment; a hand model the endpoint rejects falls back to
+# the brain model (see _with_fallback).
+_BRAIN_MODEL = os.environ.get("APTOP_BRAIN_MODEL", "local-model")
+_HAND_MODEL = os.environ.get("APTOP_HAND_MODEL", "llama-3.2-1b")
+_HAND_TASK = re.compile(r"^\s*(summari[sz]e|format|translate)\b", re.IGNORECASE)
+_SUMMARY_MODEL = _HAND_MODEL
+
+
+def _route_model(history) -> str:
+    """Picks the model for the reply to the latest user message in `history`."""
+    return _HAND_MODEL if _HAND_TASK.match(history[-1]["content"]) else _BRAIN_MODEL
+
+
+async def _with_fallback(call, model: str):
+    """Awaits `call(model)`, retrying once on `_BRAIN_MODEL` if the endpoint rejects `model`."""
+    try:
+        return await call(model)
+    except APIStatusError as e:
+        if model == _BRAIN_MODEL:
+            raise
+        logging.getLogger(__name__).warning(
+            f"Model {model!r} failed with HTTP {e.status_code}, retrying on {_BRAIN_MODEL!r}")
+        return await call(_BRAIN_MODEL)
+
+
+class _HistoryHasher:
     """
-    Custom thread-safe context manager with lock and UUID.
+    Response-cache key for a chat history that only grows at the end.
+
+    Each message is fed to a running blake2b once, so a turn costs O(new
+    messages) rather than re-serialising the whole history. Call `reset` after
+    anything rewrites earlier messages (such as `HistoryCompactor.compact`).
+    `model` is folded into the key only, so replies cached for one model are
+    never served for another.
     """
     def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._hasher = hashlib.blake2b()
+        self._hashed = 0
+
+    def key(self, history, model: str = "") -> str:
+        for message in history[self._hashed:]:
+            self._hasher.update(orjson.dumps(message, option=orjson.OPT_SORT_KEYS))
+        self._hashed = len(history)
+        # Digest a copy so the running state keeps accepting updates.
+        digest = self._hasher.copy()
+        digest.update(orjson.dumps(model))
+        return digest.hexdigest()
+
+
+async def _stream_completion(client: AsyncOpenAI, history: list, model: str = _BRAIN_MODEL,
+                             cache_control: bool = False) -> tuple[str, bool]:
+    """
+    Streams one assistant reply for `history` to stdout.
+
+    Returns the text and whether the stream reached `[DONE]`; a reply cut off
+    early must not be cached. An `error` event raises `APIError`, as the SDK's
+    own stream does.
+
+    The system prompt leads every request unchanged, so the server can reuse the
+    processed prefix across turns; keep volatile text (timestamps, ids) out of it.
+    `cache_control` additionally marks it as a cache breakpoint for
+    Anthropic-compatible backends, which only cache prefixes that are marked.
+    """
+    system, *turns = history
+    if cache_control:
+        system = {"role": system["role"],
+                  "content": [{"type": "text", "text": system["content"], "cache_control": {"type": "ephemeral"}}]}
+    parts: list[str] = []
+    # Bound once so the per-token path is local loads rather than attribute lookups.
+    append = parts.append
+    # Tokens go straight to the byte buffer, skipping the text layer's per-write
+    # newline scan; flush the text layer first so earlier print() output stays ahead.
+    # Encoded as the text layer would, so print()ed prompts and streamed tokens
+    # share one encoding; streams without a buffer (ipykernel) take text as-is.
+    stdout = sys.stdout
+    stdout.flush()
+    out = getattr(stdout, "buffer", None)
+    if out is not None:
+        encoding = stdout.encoding or "utf-8"
+        write_bytes = out.write
+
+        def write(text: str):
+            write_bytes(text.encode(encoding, "replace"))
+        flush = out.flush
+    else:
+        write = stdout.write
+        flush = stdout.flush
+    loads = orjson.loads
+    done = False
+    # Raw SSE lines rather than the SDK's parsed chunks: each event costs one
+    # orjson.loads instead of building and validating a pydantic model.
+    monotonic = time.monotonic
+    flush_at = monotonic()
+    try:
+        async with client.chat.completions.with_streaming_response.create(
+            model=model,
+            messages=[system, *turns],
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True},
+        ) as response:
+            async for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    done = True
+                    break
+                chunk = loads(payload)
+                error = chunk.get("error")
+                if error:
+                    message = error.get("message") if isinstance(error, dict) else None
+                    if not message or not isinstance(message, str):
+                        message = "An error occurred during streaming"
+                    raise APIError(message, response.http_request, body=error)
+                usage = chunk.get("usage")
+                if usage:
+                    details = usage.get("prompt_tokens_details") or {}
+                    logging.getLogger(__name__).info(
+                        f"Prompt tokens: {usage.get('prompt_tokens')}, cached: {details.get('cached_tokens', 0)}")
+                choices = chunk.get("choices")
+                if not choices:
+                    continue
+                delta = choices[0]["delta"].get("content")
+                if delta:
+                    append(delta)
+                    write(delta)
+                    now = monotonic()
+                    if len(parts) % _FLUSH_EVERY == 0 or now >= flush_at:
+                        flush()
+                        flush_at = now + _FLUSH_INTERVAL
+    finally:
+        # Also on errors, so partial output lands before any traceback.
+        flush()
+    return "".join(parts), done
+
+
+class HistoryCompactor:
+    """
+    Caps prompt growth by summarising the middle of a chat history in place.
+
+    The system prompt and the last `keep` messages stay verbatim, so the cached
+    prompt prefix and the immediate context survive; older turns (including any
+    earlier summary) are replaced by a single system message. The first failed
+    or empty summary turns compaction off for the rest of the session, so an
+    over-budget history doesn't cost a doomed request before every prompt.
+    """
+    def __init__(self, client: AsyncOpenAI, budget: int = _HISTORY_BUDGET, keep: int = _KEEP_TURNS,
+                 model: str = _SUMMARY_MODEL):
+        self.client = client
+        self.budget = budget
+        self.keep = keep
+        self.model = model
+        self.available = True
+
+    async def compact(self, history: list) -> bool:
+        """Summarises `history` if it is over budget; returns whether it was rewritten."""
+        keep = self.keep
+        if not self.available or len(history) <= keep + 2 or sum(len(m["content"]) for m in history) <= self.budget:
+            return False
+        messages = [{"role": "user", "content": "Summarize:" + orjson.dumps(history[1:-keep]).decode()}]
+        try:
+            response = await _with_fallback(
+                lambda m: self.client.chat.completions.create(model=m, messages=messages), self.model)
+        except OpenAIError as e:
+            self.available = False
+            logging.getLogger(__name__).warning(f"Summarising history failed, disabling compaction: {e}")
+            return False
+        summary = response.choices[0].message.content if response.choices else None
+        if not summary:
+            self.available = False
+            logging.getLogger(__name__).warning("Summary came back empty, disabling compaction")
+            return False
+        history[1:-keep] = [{"role": "system", "content": "Conversation summary: " + summary}]
+        return True
+
+
+class ResponseCache:
+    """
+    Exact-match reply cache keyed by `_HistoryHasher.key(history)`, evicting in LRU order.
+
+    This is the only state chat sessions share, so it carries its own lock
+    instead of the sessions serialising on one. With a `path`, replies are also
+    written through to a sqlite-backed `diskcache.Cache` (opened on first use)
+    and kept for `ttl` seconds, so a restarted session still hits on its first turn.
+    """
+    def __init__(self, maxsize: int = 512, path: str | None = None, ttl: float = 6 * 3600):
+        self.maxsize = maxsize
+        self.path = path
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._disk = None
+        self._lock = threading.Lock()
+
+    def _store(self):
+        # Called with self._lock held, so concurrent first uses open one store.
+        if self._disk is None and self.path is not None:
+            self._disk = diskcache.Cache(os.path.expanduser(self.path), size_limit=2 ** 30)
+        return self._disk
+
+    def get(self, key: str):
+        with self._lock:
+            reply = self._entries.get(key)
+            if reply:
+                self._entries.move_to_end(key)
+                return reply
+            disk = self._store()
+        if disk is None:
+            return None
+        reply = disk.get(key)
+        if not reply:
+            return None
+        with self._lock:
+            self._remember(key, reply)
+        return reply
+
+    def put(self, key: str, reply: str):
+        """Caches `reply` under `key`; empty replies are never stored."""
+        if not reply:
+            return
+        with self._lock:
+            self._remember(key, reply)
+            disk = self._store()
+        if disk is not None:
+            disk.set(key, reply, expire=self.ttl)
+
+    def _remember(self, key: str, reply: str):
+        # Caller holds self._lock.
+        self._entries[key] = reply
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# Characters of the preceding assistant turn embedded alongside a prompt, so a
+# short follow-up ("yes", "why?") only matches one asked in a similar context.
+_SEMANTIC_CONTEXT = 1000
+
+
+def _semantic_text(previous: dict, prompt: str) -> str:
+    """Text the semantic cache embeds for `prompt` sent after the message `previous`."""
+    if previous["role"] != "assistant":
+        return prompt
+    return previous["content"][-_SEMANTIC_CONTEXT:] + "\n\n" + prompt
+
+
+class SemanticCache:
+    """
+    Reuses replies for prompts whose embedding is close to one already answered.
+
+    Embeddings are L2-normalised, so one matrix-vector product gives the cosine
+    similarity against every stored prompt. The first failed embedding call
+    (typically an endpoint without the embedding model) turns the cache off
+    for the rest of the session.
+    """
+    def __init__(self, client: AsyncOpenAI, model: str = "text-embedding-3-small", threshold: float = 0.9):
+        self.client = client
+        self.model = model
+        self.threshold = threshold
+        self.available = True
+        self._embeddings = None  # (N, D) float32
+        self._replies: list[str] = []
+
+    async def embed(self, text: str):
+        """Returns the normalised embedding of `text`, or None if the endpoint can't provide one."""
+        if not self.available:
+            return None
+        try:
+            response = await self.client.embeddings.create(model=self.model, input=text)
+        except OpenAIError as e:
+            if self.available:
+                self.available = False
+                logging.getLogger(__name__).warning(f"Embedding failed, disabling semantic cache: {e}")
+            return None
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(self, query):
+        if query is None or self._embeddings is None:
+            return None
+        similarities = self._embeddings @ query
+        best = int(similarities.argmax())
+        return self._replies[best] if similarities[best] > self.threshold else None
+
+    def add(self, query, reply: str):
+        if query is None:
+            return
+        row = query[np.newaxis, :]
+        self._embeddings = row if self._embeddings is None else np.vstack((self._embeddings, row))
+        self._replies.append(reply)
+
+
+class _Prefetcher:
+    """
+    Embeds the prompt while the user is still typing it.
+
+    Each edit restarts a `delay`-second debounce; once it elapses the current
+    buffer text (after the last message of `history`, as `chat_loop` will embed
+    it) is embedded in the background. On Enter, `take` hands back that
+    embedding if it was computed for exactly the submitted text, so a user who
+    pauses before submitting never waits on the embedding round trip.
+    """
+    def __init__(self, semantic_cache: SemanticCache, history: list, delay: float = 0.3):
+        self.semantic_cache = semantic_cache
+        self.history = history
+        self.delay = delay
+        self._task = None
+        self._text = None
+        self._fired = False
+
+    def on_text_changed(self, buffer) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._text = buffer.text
+        self._fired = False
+        if self._text.strip() and self.semantic_cache.available:
+            self._task = asyncio.ensure_future(self._embed(self._text))
+
+    async def _embed(self, text: str):
+        await asyncio.sleep(self.delay)
+        self._fired = True
+        return await self.semantic_cache.embed(_semantic_text(self.history[-1], text))
+
+    async def take(self, text: str):
+        """Returns the prefetched embedding for `text`, or None if there isn't one."""
+        task, self._task = self._task, None
+        if task is None:
+            return None
+        # Still debouncing means the user hit Enter mid-burst; embedding afresh is no slower.
+        if self._text != text or not self._fired:
+            task.cancel()
+            return None
+        try:
+            return await task
+        except asyncio.CancelledError:
+            return None
+
+
+async def chat_loop(client: AsyncOpenAI, history: list, cached_responses: ResponseCache,
+                    cache_control: bool = False) -> None:
+    """
+    Runs the interactive chat REPL on the event loop.
+
+    Replies stream as they arrive, and input is read with prompt_toolkit's
+    `prompt_async`, so waiting on the keyboard never blocks other tasks on the
+    loop and the semantic-cache embedding can be prefetched while the user types.
+    `cache_control` is passed through to `_stream_completion`.
+    """
+    semantic_cache = SemanticCache(client)
+    compactor = HistoryCompactor(client)
+    hasher = _HistoryHasher()
+    prefetcher = _Prefetcher(semantic_cache, history)
+    session = PromptSession()
+    session.default_buffer.on_text_changed += prefetcher.on_text_changed
+    prefetched = None
+
+    # Closing the client on the way out also closes its connection pool.
+    async with client:
+        while True:
+            model = _route_model(history)
+            key = hasher.key(history, model)
+            # An exact hit is replayed as-is: get() already promoted it, and
+            # re-putting would slide its disk expiry forward on every replay.
+            reply = cached_responses.get(key)
+            if reply is None:
+                query = prefetched
+                if query is None:
+                    query = await semantic_cache.embed(_semantic_text(history[-2], history[-1]["content"]))
+                reply = semantic_cache.lookup(query)
+                if reply is not None:
+                    cached_responses.put(key, reply)
+
+            if reply is not None:
+                print(reply, end="", flush=True)
+            else:
+                reply, complete = await _with_fallback(
+                    lambda m: _stream_completion(client, history, model=m, cache_control=cache_control),
+                    model)
+                if complete and reply:
+                    semantic_cache.add(query, reply)
+                    cached_responses.put(key, reply)
+
+            history.append({"role": "assistant", "content": reply})
+            if await compactor.compact(history):
+                hasher.reset()
+
+            print()
+            text = await session.prompt_async("> ")
+            prefetched = await prefetcher.take(text)
+            history.append({"role": "user", "content": text})
+
+
+class ThreadSafeContextManager(BaseContextManager, ABC):
+    """
+    Custom context manager tagged with a per-process sequence number.
+
+    Entering holds no lock: contexts guard no shared state themselves, so
+    sessions in different threads run concurrently. Shared state (such as
+    `ResponseCache`) locks internally.
+
+    Only `shared` contexts are numbered and announce entry/exit; a private one
+    (the default) makes `with` a plain pass-through.
+    """
+    # next() on a count is atomic under the GIL, and unlike uuid4() it needs no urandom read.
+    _id_gen = itertools.count()
+
+    def __init__(self, shared: bool = False):
         super().__init__()
-        self.lock = threading.Lock()
-        self.uuid = uuid.uuid4()
+        self._shared = shared
+        self.uuid = next(ThreadSafeContextManager._id_gen) if shared else None
 
     def __enter__(self):
-        self.lock.acquire()
-        print(f"Entering context with UUID: {self.uuid}")
+        if self._shared:
+            print(f"Entering context with UUID: {self.uuid}")
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        try:
-            if exc_type is not None:
-                print(f"Exception caught in UUID {self.uuid}: {exc_value}")
-            # Any other resource cleanup can be done here.
-        finally:
-            self.lock.release()
-            print(f"Exiting context with UUID: {self.uuid}")
-            # Optionally, return True to suppress the exception if handled
+        if not self._shared:
+            return
+        if exc_type is not None:
+            print(f"Exception caught in UUID {self.uuid}: {exc_value}")
+        # Any other resource cleanup can be done here.
+        print(f"Exiting context with UUID: {self.uuid}")
+        # Optionally, return True to suppress the exception if handled
 
     @classmethod
     def _root(cls):
-        return logging.getLogger(cls.__name__)
+        # Cached per class (hence cls.__dict__, not getattr) to skip getLogger's module lock.
+        logger = cls.__dict__.get('_logger')
+        if logger is None:
+            logger = cls._logger = logging.getLogger(cls.__name__)
+        return logger
 
 
-class OpenAIContext(ThreadSafeContextManager, OpenAI, ABC):
-    def __init__(self, api_key: str, engine: str, endpoint: str, model: str, **kwargs):
-        super().__init__(**kwargs)
+class OpenAIContext(ThreadSafeContextManager):
+    """
+    Wraps an `OpenAI` client (composition, not inheritance) on the shared HTTP
+    pool; contexts for the same key and endpoint share one via `_get_client`.
+    """
+    cached_responses = ResponseCache(maxsize=512, path="~/.aptop/cache")
+
+    def __init__(self, api_key: str, engine: str, endpoint: str, model: str, shared: bool = False, **kwargs):
+        super().__init__(shared=shared)
         self.api_key = api_key
         self.engine = engine
         self.endpoint = endpoint
         self.model = model
         self.kwargs = kwargs
-        self.openai = OpenAI(api_key=self.api_key)
+        self.openai = _get_client(api_key, endpoint)
 
     def __enter__(self):
+        super().__enter__()
         return self.openai
 
     def __exit__(self, exc_type, exc_value, traceback):
         super().__exit__(exc_type, exc_value, traceback)
-        pass
 
-    client = OpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
+
+def main():
+    # Set APTOP_CACHE_CONTROL=1 when the endpoint is Anthropic-compatible and
+    # only caches prompt prefixes that carry an explicit breakpoint.
+    cache_control = os.environ.get("APTOP_CACHE_CONTROL") == "1"
+    client = AsyncOpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio",
+                         http_client=httpx.AsyncClient(http2=True, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS))
 
     history = [
         {"role": "system",
@@ -61,21 +529,8 @@ class OpenAIContext(ThreadSafeContextManager, OpenAI, ABC):
          "content": "Hello, introduce yourself to someone opening this program for the first time. Be concise."},
     ]
 
-    while True:
-        completion = client.chat.completions.create(
-            messages=history,
-            temperature=0.7,
-            stream=True,
-        )
-
-        new_message = {"role": "assistant", "content": ""}
-
-        for chunk in completion:
-            if chunk.choices[0].delta.content:
-                print(chunk.choices[0].delta.content, end="", flush=True)
-                new_message["content"] += chunk.choices[0].delta.content
+    asyncio.run(chat_loop(client, history, OpenAIContext.cached_responses, cache_control=cache_control))
 
-        history.append(new_message)
 
-        print()
-        history.append({"role": "user", "content": input("> ")})
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""Compiled codec for AtomDataclass values.
+
+Mirrors the pure-Python path in ``main.AtomDataclass`` byte for byte; main.py
+falls back to that path when this module has not been built::
+
+    python setup.py build_ext --inplace
+
+Wire format: every value is a one-byte type tag followed by its payload.
+
+    string      varint byte length + utf-8 bytes
+    integer     zigzag varint (int64 range)
+    float       !d
+    boolean     ?
+    list        varint element count + encoded elements
+    dictionary  varint entry count + encoded key/value pairs
+
+Varints are unsigned LEB128: 7 bits per byte, least significant group first,
+high bit set on every byte but the last.
+"""
+from libc.stdint cimport int64_t, uint64_t
+from libc.stdlib cimport free, malloc, realloc
+from libc.string cimport memcpy
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+
+cdef enum:
+    TAG_STR = 0
+    TAG_INT = 1
+    TAG_FLOAT = 2
+    TAG_BOOL = 3
+    TAG_LIST = 4
+    TAG_DICT = 5
+
+
+cdef struct _Out:
+    char* data
+    Py_ssize_t size
+    Py_ssize_t cap
+
+
+cdef int _reserve(_Out* out, Py_ssize_t n) except -1:
+    cdef Py_ssize_t cap
+    cdef char* data
+    if out.size + n <= out.cap:
+        return 0
+    cap = out.cap * 2
+    while cap < out.size + n:
+        cap *= 2
+    data = <char*>realloc(out.data, cap)
+    if data == NULL:
+        raise MemoryError()
+    out.data = data
+    out.cap = cap
+    return 0
+
+
+cdef inline int _write_u8(_Out* out, unsigned char v) except -1:
+    _reserve(out, 1)
+    out.data[out.size] = <char>v
+    out.size += 1
+    return 0
+
+
+cdef inline int _write_varint(_Out* out, uint64_t v) except -1:
+    _reserve(out, 10)
+    while v > 0x7F:
+        out.data[out.size] = <char>((v & 0x7F) | 0x80)
+        out.size += 1
+        v >>= 7
+    out.data[out.size] = <char>v
+    out.size += 1
+    return 0
+
+
+cdef inline int _write_u64(_Out* out, uint64_t v) except -1:
+    cdef int i
+    _reserve(out, 8)
+    for i in range(8):
+        out.data[out.size + i] = <char>((v >> (56 - 8 * i)) & 0xFF)
+    out.size += 8
+    return 0
+
+
+cdef inline int _write_raw(_Out* out, const char* src, Py_ssize_t n) except -1:
+    _reserve(out, n)
+    memcpy(out.data + out.size, src, n)
+    out.size += n
+    return 0
+
+
+cdef int _encode_scalar(_Out* out, int type_tag, object value) except -1:
+    cdef int64_t i
+    cdef double d
+    cdef uint64_t bits
+    cdef bytes raw
+
+    if type_tag == TAG_STR:
+        raw = (<str>value).encode('utf-8')
+        _write_varint(out, <uint64_t>len(raw))
+        _write_raw(out, raw, len(raw))
+    elif type_tag == TAG_INT:
+        i = value
+        _write_varint(out, (<uint64_t>i << 1) ^ <uint64_t>(i >> 63))
+    elif type_tag == TAG_FLOAT:
+        d = value
+        memcpy(&bits, &d, 8)
+        _write_u64(out, bits)
+    else:
+        _write_u8(out, 1 if value else 0)
+    return 0
+
+
+cdef int _encode_value(_Out* out, object root) except -1:
+    # Walks containers with an explicit stack, like the pure-Python path, so
+    # nesting depth is bounded by memory rather than the C stack.
+    cdef int type_tag
+    cdef list stack = [root]
+    cdef object value, t
+
+    while stack:
+        value = stack.pop()
+        t = type(value)
+        if t is str:
+            type_tag = TAG_STR
+        elif t is bool:
+            type_tag = TAG_BOOL
+        elif t is int:
+            type_tag = TAG_INT
+        elif t is float:
+            type_tag = TAG_FLOAT
+        elif t is list:
+            type_tag = TAG_LIST
+        elif t is dict:
+            type_tag = TAG_DICT
+        else:
+            raise ValueError(f"Unsupported data type: {t.__name__.lower()}")
+
+        _write_u8(out, type_tag)
+        if type_tag == TAG_LIST:
+            _write_varint(out, <uint64_t>len(<list>value))
+            stack.extend(reversed(<list>value))
+        elif type_tag == TAG_DICT:
+            _write_varint(out, <uint64_t>len(<dict>value))
+            for key, item in reversed((<dict>value).items()):
+                stack.append(item)
+                stack.append(key)
+        else:
+            _encode_scalar(out, type_tag, value)
+    return 0
+
+
+cpdef bytes encode(object value):
+    cdef _Out out
+    out.size = 0
+    out.cap = 64
+    out.data = <char*>malloc(out.cap)
+    if out.data == NULL:
+        raise MemoryError()
+    try:
+        _encode_value(&out, value)
+        return PyBytes_FromStringAndSize(out.data, out.size)
+    finally:
+        free(out.data)
+
+
+cdef inline int _need(Py_ssize_t pos, Py_ssize_t n, Py_ssize_t end) except -1:
+    if pos + n > end:
+        raise ValueError("Truncated atom data")
+    return 0
+
+
+cdef uint64_t _read_varint(const unsigned char[::1] buf, Py_ssize_t* pos) except? 0:
+    cdef Py_ssize_t end = buf.shape[0]
+    cdef uint64_t v = 0
+    cdef unsigned char byte
+    cdef int shift = 0
+    while True:
+        _need(pos[0], 1, end)
+        byte = buf[pos[0]]
+        pos[0] += 1
+        # A uint64 fits in ten groups, the tenth holding only the top bit.
+        if shift == 63 and byte > 1:
+            raise ValueError("Varint too long")
+        v |= <uint64_t>(byte & 0x7F) << shift
+        if byte < 0x80:
+            return v
+        shift += 7
+
+
+cdef inline uint64_t _read_u64(const unsigned char[::1] buf, Py_ssize_t pos):
+    cdef uint64_t v = 0
+    cdef int i
+    for i in range(8):
+        v = (v << 8) | buf[pos + i]
+    return v
+
+
+cdef object _decode_scalar(const unsigned char[::1] buf, Py_ssize_t* pos, int type_tag):
+    cdef Py_ssize_t end = buf.shape[0]
+    cdef uint64_t n, bits
+    cdef double d
+
+    if type_tag == TAG_STR:
+        n = _read_varint(buf, pos)
+        if n > <uint64_t>(end - pos[0]):
+            raise ValueError("Truncated atom data")
+        value = PyUnicode_DecodeUTF8(<const char*>&buf[pos[0]], n, NULL)
+        pos[0] += n
+        return value
+    elif type_tag == TAG_INT:
+        bits = _read_varint(buf, pos)
+        return <int64_t>((bits >> 1) ^ (~(bits & 1) + 1))
+    elif type_tag == TAG_FLOAT:
+        _need(pos[0], 8, end)
+        bits = _read_u64(buf, pos[0])
+        pos[0] += 8
+        memcpy(&d, &bits, 8)
+        return d
+    else:
+        _need(pos[0], 1, end)
+        pos[0] += 1
+        return buf[pos[0] - 1] != 0
+
+
+cdef object _NO_KEY = object()
+
+
+cdef object _decode_value(const unsigned char[::1] buf, Py_ssize_t* pos):
+    cdef Py_ssize_t end = buf.shape[0]
+    cdef int type_tag
+    cdef uint64_t n
+    # Open containers as [container, children still expected, pending dict key],
+    # mirroring main._decode_value so hostile nesting can't exhaust the C stack.
+    cdef list stack = []
+    cdef list frame
+    cdef object value, container
+
+    while True:
+        _need(pos[0], 1, end)
+        type_tag = buf[pos[0]]
+        pos[0] += 1
+
+        if type_tag == TAG_LIST or type_tag == TAG_DICT:
+            if stack:
+                frame = <list>stack[len(stack) - 1]
+                if frame[2] is _NO_KEY and type(frame[0]) is dict:
+                    raise ValueError("Unhashable dictionary key")
+            n = _read_varint(buf, pos)
+            value = [] if type_tag == TAG_LIST else {}
+            if n:
+                stack.append([value, n, _NO_KEY])
+                continue
+        elif type_tag < TAG_LIST:
+            value = _decode_scalar(buf, pos, type_tag)
+        else:
+            raise ValueError(f"Unsupported data type tag: {type_tag}")
+
+        # Attach the finished value to its parent, closing any containers it completes.
+        while stack:
+            frame = <list>stack[len(stack) - 1]
+            container = frame[0]
+            if type(container) is list:
+                (<list>container).append(value)
+            elif frame[2] is _NO_KEY:
+                frame[2] = value
+                break
+            else:
+                (<dict>container)[frame[2]] = value
+                frame[2] = _NO_KEY
+            frame[1] -= 1
+            if frame[1]:
+                break
+            stack.pop()
+            value = container
+        else:
+            return value
+
+
+cpdef tuple decode(const unsigned char[::1] buf, Py_ssize_t offset):
+    """Decode one value starting at ``offset``; returns ``(value, new_offset)``."""
+    cdef Py_ssize_t pos = offset
+    if offset < 0 or offset > buf.shape[0]:
+        raise ValueError(f"Offset {offset} outside buffer of length {buf.shape[0]}")
+    value = _decode_value(buf, &pos)
+    return value, pos
@@ -0,0 +1,150 @@
+"""Wire-format tests for the AtomDataclass codec.
+
+The pure-Python path in main.py and the compiled src/atom_codec.pyx must stay
+byte-for-byte compatible; the compiled cases are skipped unless it is built
+(``python setup.py build_ext --inplace``).
+"""
+import pytest
+
+import main
+from main import AtomDataclass
+
+try:
+    import atom_codec
+except ImportError:
+    atom_codec = None
+
+
+def py_encode(value):
+    out = bytearray()
+    main._encode_value(out, value)
+    return bytes(out)
+
+
+def py_decode(data, offset=0):
+    return main._decode_value(data, offset)
+
+
+CODECS = [pytest.param((py_encode, py_decode), id="python")]
+if atom_codec is not None:
+    CODECS.append(pytest.param((atom_codec.encode, atom_codec.decode), id="cython"))
+
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+VALUES = [
+    "",
+    "héllo ✓",
+    0,
+    -1,
+    300,
+    INT64_MIN,
+    INT64_MAX,
+    1.5,
+    -0.0,
+    True,
+    False,
+    [],
+    {},
+    [1, "two", 3.0, [False, {}]],
+    {"a": [1, {"b": True}], "": "", "n": -7},
+]
+
+
+def nested_list(depth):
+    value = []
+    for _ in range(depth):
+        value = [value]
+    return value
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("value", VALUES)
+def test_round_trip(codec, value):
+    encode, decode = codec
+    data = encode(value)
+    decoded, offset = decode(data, 0)
+    assert decoded == value
+    assert type(decoded) is type(value)
+    assert offset == len(data)
+
+
+@pytest.mark.skipif(atom_codec is None, reason="atom_codec not built")
+@pytest.mark.parametrize("value", VALUES)
+def test_compiled_codec_matches_python_bytes(value):
+    assert atom_codec.encode(value) == py_encode(value)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_bool_and_int_keep_distinct_tags(codec):
+    encode, decode = codec
+    assert encode(True) == bytes([main._TAG_BOOL, 1])
+    assert encode(1) == bytes([main._TAG_INT, 2])
+    assert decode(encode([True, 1]), 0)[0] == [True, 1]
+    assert [type(v) for v in decode(encode([True, 1]), 0)[0]] == [bool, int]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("value", [INT64_MIN - 1, INT64_MAX + 1])
+def test_int_outside_int64_is_rejected(codec, value):
+    encode, _ = codec
+    with pytest.raises(OverflowError):
+        encode(value)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_overlong_varint_is_rejected(codec):
+    _, decode = codec
+    with pytest.raises(ValueError, match="Varint too long"):
+        decode(bytes([main._TAG_INT]) + b"\xff" * 9 + b"\x02", 0)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_deep_nesting(codec):
+    encode, decode = codec
+    depth = 200_000
+    data = encode(nested_list(depth))
+    assert data == bytes([main._TAG_LIST, 1]) * depth + bytes([main._TAG_LIST, 0])
+    value, offset = decode(data, 0)
+    assert offset == len(data)
+    for _ in range(depth):
+        value = value[0]
+    assert value == []
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("value", VALUES)
+def test_truncated_input_is_rejected(codec, value):
+    encode, decode = codec
+    data = encode(value)
+    for end in range(len(data)):
+        with pytest.raises(ValueError):
+            decode(data[:end], 0)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("data", [
+    bytes([main._TAG_DICT, 1, main._TAG_LIST, 0, main._TAG_INT, 2]),
+    bytes([main._TAG_DICT, 1, main._TAG_DICT, 0, main._TAG_INT, 2]),
+    bytes([main._TAG_LIST, 1, main._TAG_DICT, 1, main._TAG_LIST, 0, main._TAG_INT, 2]),
+])
+def test_container_dict_key_is_rejected(codec, data):
+    _, decode = codec
+    with pytest.raises(ValueError, match="Unhashable dictionary key"):
+        decode(data, 0)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("offset", [-1, -100_000, 3])
+def test_offset_outside_buffer_is_rejected(codec, offset):
+    _, decode = codec
+    with pytest.raises(ValueError):
+        decode(b"\x01\x02", offset)
+
+
+def test_atom_dataclass_round_trip():
+    atom = AtomDataclass({"k": [1, 2.5, "x", True]})
+    decoded = AtomDataclass(None)
+    decoded.decode(atom.encode())
+    assert decoded == atom
+    assert decoded.data_type == "dictionary"
+    assert decoded.data_type_tag == main._TAG_DICT
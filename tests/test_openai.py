@@ -0,0 +1,368 @@
+"""Tests for the chat REPL plumbing in src/app/openai.py.
+
+Every request goes through an `httpx.MockTransport`, so nothing touches the
+network; `chat_loop` runs with a scripted stand-in for prompt_toolkit's
+`PromptSession`.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+pytest.importorskip("openai")
+from openai import APIError, APIStatusError, AsyncOpenAI
+
+import src.app.openai as chat
+
+SYSTEM = {"role": "system", "content": "be brief"}
+
+
+def sse(*events, done=True):
+    lines = [f"data: {json.dumps(event)}\n\n" for event in events]
+    if done:
+        lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode()
+
+
+def deltas(*texts):
+    return [{"choices": [{"delta": {"content": text}}]} for text in texts]
+
+
+def stream_response(body):
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body)
+
+
+def completion_response(model, content):
+    return httpx.Response(200, json={
+        "id": "cmpl", "object": "chat.completion", "created": 0, "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    })
+
+
+def not_found():
+    return httpx.Response(404, json={"error": {"message": "model not found"}})
+
+
+def make_client(handler):
+    """AsyncOpenAI whose requests are answered by `handler`; records each request body."""
+    requests = []
+
+    def record(request):
+        body = json.loads(request.content) if request.content else {}
+        requests.append((request.url.path, body))
+        return handler(request.url.path, body)
+
+    client = AsyncOpenAI(base_url="http://test/v1", api_key="test", max_retries=0,
+                         http_client=httpx.AsyncClient(transport=httpx.MockTransport(record)))
+    return client, requests
+
+
+def stream(client, history, **kwargs):
+    return asyncio.run(chat._stream_completion(client, history, **kwargs))
+
+
+# _stream_completion
+
+def test_stream_completion_returns_text_and_completion(capsys):
+    client, _ = make_client(lambda path, body: stream_response(sse(*deltas("Hel", "lo"))))
+    assert stream(client, [SYSTEM, {"role": "user", "content": "hi"}]) == ("Hello", True)
+    assert capsys.readouterr().out == "Hello"
+
+
+def test_stream_completion_ignores_usage_and_comment_lines(capsys):
+    body = b": keep-alive\n\n" + sse(*deltas("a"), {"choices": [], "usage": {"prompt_tokens": 3}}, *deltas("b"))
+    client, _ = make_client(lambda path, body_: stream_response(body))
+    assert stream(client, [SYSTEM, {"role": "user", "content": "hi"}]) == ("ab", True)
+
+
+def test_stream_cut_off_before_done_is_incomplete(capsys):
+    client, _ = make_client(lambda path, body: stream_response(sse(*deltas("Hel"), done=False)))
+    assert stream(client, [SYSTEM, {"role": "user", "content": "hi"}]) == ("Hel", False)
+
+
+def test_stream_error_event_raises_and_flushes_partial_output(capsys):
+    body = sse(*deltas("Hel"), {"error": {"message": "boom"}})
+    client, _ = make_client(lambda path, body_: stream_response(body))
+    with pytest.raises(APIError, match="boom"):
+        stream(client, [SYSTEM, {"role": "user", "content": "hi"}])
+    assert capsys.readouterr().out == "Hel"
+
+
+def test_stream_cache_control_marks_system_prompt(capsys):
+    client, requests = make_client(lambda path, body: stream_response(sse()))
+    stream(client, [SYSTEM, {"role": "user", "content": "hi"}], cache_control=True)
+    system = requests[0][1]["messages"][0]
+    assert system["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert system["content"][0]["text"] == SYSTEM["content"]
+
+
+# ResponseCache
+
+def test_response_cache_evicts_least_recently_used():
+    cache = chat.ResponseCache(maxsize=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+
+def test_response_cache_rejects_empty_replies():
+    cache = chat.ResponseCache()
+    cache.put("a", "")
+    assert cache.get("a") is None
+
+
+def test_response_cache_falls_through_to_disk(tmp_path):
+    chat.ResponseCache(path=str(tmp_path)).put("a", "A")
+    restarted = chat.ResponseCache(path=str(tmp_path))
+    assert restarted.get("a") == "A"
+    assert restarted.get("missing") is None
+
+
+def test_response_cache_treats_empty_disk_entry_as_miss(tmp_path):
+    cache = chat.ResponseCache(path=str(tmp_path))
+    cache.put("a", "A")
+    cache._store().set("b", "")
+    assert chat.ResponseCache(path=str(tmp_path)).get("b") is None
+
+
+# _HistoryHasher
+
+def test_history_hasher_is_incremental():
+    history = [SYSTEM, {"role": "user", "content": "hi"}]
+    hasher = chat._HistoryHasher()
+    first = hasher.key(history)
+    history.append({"role": "assistant", "content": "hello"})
+    assert hasher.key(history) == chat._HistoryHasher().key(history) != first
+    # Taking a key doesn't disturb the running state.
+    assert hasher.key(history) == hasher.key(history)
+
+
+def test_history_hasher_keys_depend_on_model():
+    history = [SYSTEM, {"role": "user", "content": "hi"}]
+    hasher = chat._HistoryHasher()
+    assert hasher.key(history, "small") != hasher.key(history, "large")
+    assert hasher.key(history, "small") == chat._HistoryHasher().key(history, "small")
+
+
+def test_history_hasher_reset_after_rewrite():
+    history = [SYSTEM, {"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+    hasher = chat._HistoryHasher()
+    hasher.key(history)
+    history[1:2] = [{"role": "system", "content": "summary"}]
+    hasher.reset()
+    assert hasher.key(history) == chat._HistoryHasher().key(history)
+
+
+# HistoryCompactor
+
+def long_history(turns=8):
+    return [SYSTEM] + [{"role": "user" if i % 2 else "assistant", "content": "x" * 100} for i in range(turns)]
+
+
+def test_compactor_leaves_history_under_budget_alone():
+    client, requests = make_client(lambda path, body: completion_response(body["model"], "S"))
+    history = long_history()
+    assert not asyncio.run(chat.HistoryCompactor(client, budget=10_000).compact(history))
+    assert requests == []
+    assert len(history) == 9
+
+
+def test_compactor_summarises_middle_of_history():
+    client, _ = make_client(lambda path, body: completion_response(body["model"], "S"))
+    history = long_history()
+    tail = history[-4:]
+    assert asyncio.run(chat.HistoryCompactor(client, budget=10, keep=4).compact(history))
+    assert history == [SYSTEM, {"role": "system", "content": "Conversation summary: S"}, *tail]
+
+
+@pytest.mark.parametrize("handler", [
+    lambda path, body: completion_response(body["model"], ""),
+    lambda path, body: httpx.Response(500, json={"error": {"message": "down"}}),
+])
+def test_compactor_keeps_history_and_disables_after_failure(handler):
+    client, requests = make_client(handler)
+    compactor = chat.HistoryCompactor(client, budget=10)
+    history = long_history()
+    before = list(history)
+    assert not asyncio.run(compactor.compact(history))
+    assert history == before
+    assert not compactor.available
+    sent = len(requests)
+    assert not asyncio.run(compactor.compact(history))
+    assert len(requests) == sent
+
+
+# Model routing
+
+@pytest.mark.parametrize("prompt, model", [
+    ("Summarize this", chat._HAND_MODEL),
+    ("  format: {}", chat._HAND_MODEL),
+    ("Translate to French", chat._HAND_MODEL),
+    ("formatting rules?", chat._BRAIN_MODEL),
+    ("why?", chat._BRAIN_MODEL),
+])
+def test_route_model(prompt, model):
+    assert chat._route_model([SYSTEM, {"role": "user", "content": prompt}]) == model
+
+
+def test_with_fallback_retries_rejected_hand_model_on_brain_model(capsys):
+    def handler(path, body):
+        if body["model"] == chat._HAND_MODEL:
+            return not_found()
+        return stream_response(sse(*deltas("ok")))
+
+    client, requests = make_client(handler)
+    history = [SYSTEM, {"role": "user", "content": "format this"}]
+    result = asyncio.run(chat._with_fallback(lambda m: chat._stream_completion(client, history, model=m),
+                                             chat._route_model(history)))
+    assert result == ("ok", True)
+    assert [body["model"] for _, body in requests] == [chat._HAND_MODEL, chat._BRAIN_MODEL]
+
+
+def test_with_fallback_does_not_retry_brain_model(capsys):
+    client, requests = make_client(lambda path, body: not_found())
+    history = [SYSTEM, {"role": "user", "content": "why?"}]
+    with pytest.raises(APIStatusError):
+        asyncio.run(chat._with_fallback(lambda m: chat._stream_completion(client, history, model=m),
+                                        chat._BRAIN_MODEL))
+    assert len(requests) == 1
+
+
+# _Prefetcher
+
+class FakeSemanticCache:
+    available = True
+
+    async def embed(self, text):
+        await asyncio.sleep(0.01)
+        return "embedding of " + text
+
+
+def type_text(prefetcher, text):
+    prefetcher.on_text_changed(SimpleNamespace(text=text))
+
+
+def test_prefetcher_hands_back_embedding_for_submitted_text():
+    async def run():
+        prefetcher = chat._Prefetcher(FakeSemanticCache(), [SYSTEM], delay=0.01)
+        type_text(prefetcher, "hel")
+        type_text(prefetcher, "hello")
+        await asyncio.sleep(0.03)
+        return await prefetcher.take("hello")
+
+    assert asyncio.run(run()) == "embedding of hello"
+
+
+def test_prefetcher_includes_previous_assistant_turn():
+    async def run():
+        history = [SYSTEM, {"role": "assistant", "content": "Shall I go on?"}]
+        prefetcher = chat._Prefetcher(FakeSemanticCache(), history, delay=0.01)
+        type_text(prefetcher, "yes")
+        await asyncio.sleep(0.03)
+        return await prefetcher.take("yes")
+
+    assert asyncio.run(run()) == "embedding of Shall I go on?\n\nyes"
+
+
+@pytest.mark.parametrize("typed, submitted, wait", [
+    ("hello", "hello", 0.0),     # Enter pressed while still debouncing
+    ("hello", "hello!", 0.05),   # text changed after the prefetch
+])
+def test_prefetcher_discards_stale_or_early_prefetch(typed, submitted, wait):
+    async def run():
+        prefetcher = chat._Prefetcher(FakeSemanticCache(), [SYSTEM], delay=0.02)
+        type_text(prefetcher, typed)
+        await asyncio.sleep(wait)
+        return await prefetcher.take(submitted)
+
+    assert asyncio.run(run()) is None
+
+
+def test_prefetcher_skips_unavailable_semantic_cache():
+    cache = FakeSemanticCache()
+    cache.available = False
+    prefetcher = chat._Prefetcher(cache, [SYSTEM], delay=0.0)
+    type_text(prefetcher, "hello")
+    assert prefetcher._task is None
+
+
+# chat_loop
+
+class FakeEvent:
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self, handler):
+        self.handlers.append(handler)
+        return self
+
+
+class FakeSession:
+    """Answers each prompt with the next scripted input, then ends the REPL."""
+    def __init__(self, inputs):
+        self.inputs = list(inputs)
+        self.default_buffer = SimpleNamespace(on_text_changed=FakeEvent())
+
+    async def prompt_async(self, message):
+        if not self.inputs:
+            raise EOFError
+        return self.inputs.pop(0)
+
+
+def run_chat(monkeypatch, handler, history, cache, inputs=()):
+    monkeypatch.setattr(chat, "PromptSession", lambda: FakeSession(inputs))
+    client, requests = make_client(handler)
+    with pytest.raises(EOFError):
+        asyncio.run(chat.chat_loop(client, history, cache))
+    return requests
+
+
+def chat_handler(*replies):
+    replies = list(replies)
+
+    def handler(path, body):
+        if path.endswith("/embeddings"):
+            return not_found()
+        return stream_response(sse(*deltas(replies.pop(0))))
+    return handler
+
+
+def completions(requests):
+    return [body for path, body in requests if path.endswith("/chat/completions")]
+
+
+def test_chat_loop_streams_replies_and_records_history(monkeypatch, capsys):
+    history = [SYSTEM, {"role": "user", "content": "hi"}]
+    requests = run_chat(monkeypatch, chat_handler("Hello", "Sure"), history, chat.ResponseCache(), ["go on"])
+    assert [m["content"] for m in history[1:]] == ["hi", "Hello", "go on", "Sure"]
+    assert len(completions(requests)) == 2
+    # The embedding endpoint 404s once, then the semantic cache stays off.
+    assert sum(path.endswith("/embeddings") for path, _ in requests) == 1
+
+
+def test_chat_loop_replays_exact_hit_without_request(monkeypatch, capsys):
+    cache = chat.ResponseCache()
+    run_chat(monkeypatch, chat_handler("Hello"), [SYSTEM, {"role": "user", "content": "hi"}], cache)
+    history = [SYSTEM, {"role": "user", "content": "hi"}]
+    requests = run_chat(monkeypatch, chat_handler(), history, cache)
+    assert completions(requests) == []
+    assert history[-1] == {"role": "assistant", "content": "Hello"}
+
+
+def test_chat_loop_does_not_cache_incomplete_reply(monkeypatch, capsys):
+    def handler(path, body):
+        if path.endswith("/embeddings"):
+            return not_found()
+        return stream_response(sse(*deltas("Hel"), done=False))
+
+    cache = chat.ResponseCache()
+    history = [SYSTEM, {"role": "user", "content": "hi"}]
+    run_chat(monkeypatch, handler, history, cache)
+    assert history[-1] == {"role": "assistant", "content": "Hel"}
+    assert cache._entries == {}